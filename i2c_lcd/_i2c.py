@@ -0,0 +1,147 @@
+# Copyright (c) 2025 James Packer. All rights reserved.
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH
+# REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY
+# AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT,
+# INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM
+# LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR
+# OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""
+Direct access to a Linux I2C bus device (`/dev/i2c-N`).
+
+Each read or write is a single transaction using the `I2C_RDWR` ioctl. This
+does the same as `smbus2.SMBus.i2c_rdwr` but without the intermediate Python
+layers.
+"""
+
+# Configure CSpell VSCode plugin
+# cSpell:ignore  ioctl RDWR nmsgs smbus
+
+from __future__ import annotations
+
+import ctypes
+import os
+from fcntl import ioctl
+
+# Combined read/write transfer request (from linux/i2c-dev.h)
+_I2C_RDWR = 0x0707
+# Message flag for a read (from linux/i2c.h)
+_I2C_M_RD = 0x0001
+
+
+class _I2CMsg(ctypes.Structure):
+    """
+    A single message in a combined transfer: `struct i2c_msg` from
+    linux/i2c.h.
+    """
+
+    _fields_ = [
+        ("addr", ctypes.c_uint16),
+        ("flags", ctypes.c_uint16),
+        ("len", ctypes.c_uint16),
+        ("buf", ctypes.POINTER(ctypes.c_uint8)),
+    ]
+
+
+class _I2CRdwrIoctlData(ctypes.Structure):
+    """
+    The argument to the `I2C_RDWR` ioctl: `struct i2c_rdwr_ioctl_data` from
+    linux/i2c-dev.h.
+    """
+
+    _fields_ = [
+        ("msgs", ctypes.POINTER(_I2CMsg)),
+        ("nmsgs", ctypes.c_uint32),
+    ]
+
+
+class I2CDevice:
+    """
+    A device on a Linux I2C bus.
+
+    Args:
+        bus: The I2C bus number, or the path to the bus device.
+        address: The address of the device on the bus.
+
+    Raises:
+        OSError: If the bus device cannot be opened.
+    """
+
+    def __init__(self, bus: int | str, address: int):
+        path = bus if isinstance(bus, str) else f"/dev/i2c-{bus}"
+        self._address = address
+        # The buffer, message and ioctl request for writes are reused for each
+        # transaction, so writing doesn't allocate any memory. The buffer is
+        # replaced with a larger one if needed.
+        self._write_buf = bytearray()
+        self._write_msg = _I2CMsg(addr=address, flags=0, len=0)
+        self._write_request = _I2CRdwrIoctlData(
+            msgs=ctypes.pointer(self._write_msg), nmsgs=1
+        )
+        self._fd = os.open(path, os.O_RDWR)
+
+    def write(self, data: bytes):
+        """
+        Write a sequence of bytes to the device as a single transaction.
+
+        Args:
+            data: The bytes to write.
+        """
+
+        length = len(data)
+        if length > len(self._write_buf):
+            self._write_buf = bytearray(length)
+            self._write_msg.buf = (ctypes.c_uint8 * length).from_buffer(self._write_buf)
+        self._write_buf[:length] = data
+        self._write_msg.len = length
+        ioctl(self._fd, _I2C_RDWR, self._write_request)
+
+    def transfer(self, *messages: bytes | int) -> list[bytes]:
+        """
+        Carry out a combined transfer of several messages as a single
+        transaction (with a repeated start condition between messages).
+
+        Args:
+            messages: For each message, either the bytes to write or the number
+                      of bytes to read.
+
+        Returns:
+            The data read by each of the read messages, in order.
+        """
+
+        msgs = (_I2CMsg * len(messages))()
+        # Keep a reference to every buffer until the transfer is complete
+        bufs = []
+        for msg, message in zip(msgs, messages):
+            if isinstance(message, int):
+                buf = (ctypes.c_uint8 * message)()
+                msg.flags = _I2C_M_RD
+            else:
+                buf = (ctypes.c_uint8 * len(message)).from_buffer_copy(message)
+                msg.flags = 0
+            msg.addr = self._address
+            msg.len = len(buf)
+            msg.buf = buf
+            bufs.append(buf)
+        request = _I2CRdwrIoctlData(msgs=msgs, nmsgs=len(messages))
+        ioctl(self._fd, _I2C_RDWR, request)
+        return [
+            bytes(buf)
+            for buf, message in zip(bufs, messages)
+            if isinstance(message, int)
+        ]
+
+    def close(self):
+        """
+        Close the bus device.
+        """
+
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
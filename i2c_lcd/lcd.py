@@ -45,12 +45,136 @@ Raspberry Pi.
 
 from __future__ import annotations
 
+import asyncio
 import enum
+import errno
 from collections import UserList
-from enum import Enum, IntEnum
-from logging import debug, info, warning
-from time import sleep
-from typing import Any, Callable, Iterable, SupportsIndex
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from enum import Enum
+from functools import partial
+from logging import DEBUG, getLogger
+from time import monotonic, monotonic_ns, sleep
+from typing import Any, Callable, Iterable, Iterator, SupportsIndex
+
+try:
+    from smbus2 import SMBus, i2c_msg
+except ImportError:
+    SMBus = None
+
+try:
+    from ._i2c import I2CDevice
+except ImportError:
+    # Direct access to the I2C bus device is only available on Linux
+    I2CDevice = None
+
+_log = getLogger(__name__)
+
+# The time this module was loaded, used to work out how much of the power-on
+# delay has already passed when an LCD object is created
+_MODULE_LOAD_TIME = monotonic()
+
+
+def _delay(seconds: float):
+    """
+    Wait for a period of time. Delays shorter than 2ms are done by busy-waiting,
+    as `sleep` can take significantly longer than requested on a system that
+    is not real-time.
+
+    Args:
+        seconds: The time to wait.
+    """
+
+    if seconds >= 0.002:
+        sleep(seconds)
+        return
+    deadline = monotonic_ns() + int(seconds * 1_000_000_000)
+    while monotonic_ns() < deadline:
+        pass
+
+
+def _smbus_transfer(smbus: SMBus, address: int, data: bytes):
+    """
+    Write a sequence of bytes to an I2C address as a single transaction, using
+    smbus2. Used when the bus device can't be accessed directly.
+
+    Args:
+        smbus: The open bus.
+        address: The I2C address to write to.
+        data: The bytes to write.
+    """
+
+    smbus.i2c_rdwr(i2c_msg.write(address, data))
+
+
+def _run_all(functions: list[Callable]):
+    """
+    Call each of a list of functions in turn.
+    """
+
+    for function in functions:
+        function()
+
+
+def _no_transfer(data: bytes):
+    """
+    Used in place of an I2C write when the bus is not available.
+    """
+
+
+def _build_lut(control: int, enable: int) -> tuple[bytes, ...]:
+    """
+    Build a table of the bytes to be written to the I2C expander to transfer
+    each possible byte value to the LCD controller.
+
+    Args:
+        control: The register select, write and backlight bits.
+        enable: The Enable bit.
+
+    Returns:
+        A tuple, indexed by byte value, of four-byte sequences.
+    """
+
+    lut = []
+    for value in range(256):
+        # Data has to be written as two 4-bit values, upper bits first. The
+        # data to be written must be in the upper 4 bits of each byte.
+        hi = (value & 0xF0) | control
+        lo = ((value & 0x0F) << 4) | control
+        # Each 4-bit value is applied to the LCD controller with the Enable bit
+        # asserted, then the Enable bit is de-asserted to complete the write.
+        # The controller latches the data on the falling edge of Enable, and
+        # the data must still be valid at that point, so neither byte can be
+        # left out or merged with the next 4-bit value.
+        lut.append(bytes((hi | enable, hi, lo | enable, lo)))
+    return tuple(lut)
+
+
+def _build_address_table(
+    lut: tuple[bytes, ...],
+    line_addresses: tuple[int, ...],
+    line_length: int,
+    command: int,
+) -> tuple[tuple[bytes, ...], ...]:
+    """
+    Build a table of the bytes to be written to the I2C expander to set the
+    display memory address to each character position.
+
+    Args:
+        lut: The table built by `_build_lut` for the instruction register.
+        line_addresses: The display memory start address of each line.
+        line_length: The number of characters of display memory per line.
+        command: The command to set the display memory address.
+
+    Returns:
+        A tuple, indexed by line number then character position, of four-byte
+        sequences.
+    """
+
+    return tuple(
+        tuple(lut[command | (start + position)] for position in range(line_length))
+        for start in line_addresses
+    )
 
 
 # pylint: disable=too-many-instance-attributes
@@ -61,10 +185,19 @@ class LCD(UserList):
 
     Args:
         iterable: A list of strings to initialise the display with.
-        width: The character width of the display.
-        height: The number of lines in the display.
+        width: The character width of the display, up to 40.
+        height: The number of lines in the display, up to 4.
         i2c_address: The address of the display on the I2C bus.
         i2c_bus: The I2C bus that the device is connected to.
+        background_writes: If True, data is written to the display by a worker
+            thread, so updating the display doesn't wait for the I2C bus.
+            Updates are still written in the order they are made.
+        i2c_clock_hz: The I2C bus clock frequency the display is expected to be
+            used with. If given, a warning is logged if the bus is configured
+            with a lower frequency.
+
+    Raises:
+        ValueError: If the display size is not supported by the LCD controller.
     """
 
     class TruncateMode(Enum):
@@ -99,16 +232,19 @@ class LCD(UserList):
         BLINK = enum.auto()
         UNDERSCORE = enum.auto()
 
-    class _Commands(IntEnum):
+    class _Commands:
         """
         Definitions of command bits. Most functions have a "set" bit to define
         the function and then a number of other bits to define the parameters.
+
+        These are plain `int` class attributes, rather than an `IntEnum`, so
+        that combining them is simple integer arithmetic.
         """
 
         # fmt: off
 
-        # Clear the display. This is slow (not sure how slow) so needs a delay
-        # after executing it
+        # Clear the display. This takes about 1.52ms (the same as return home)
+        # so needs a delay after executing it
         CLEAR_DISPLAY           = 0b0000_0001
         # Set the cursor (DDRAM address) to 0,0 and undo any shift of the
         # display. The requires about 1.5ms.
@@ -157,6 +293,14 @@ class LCD(UserList):
         SET_DDRAM_ADDRESS       = 0b1000_0000
         # fmt: on
 
+    # The display mode bits for each type of cursor
+    _CURSOR_BITS = {
+        Cursor.NONE: 0,
+        Cursor.BLINK: _Commands.BLINK_ON,
+        Cursor.UNDERSCORE: _Commands.CURSOR_ON,
+    }
+    _CURSOR_MASK = _Commands.CURSOR_ON | _Commands.BLINK_ON
+
     # Control bits on the LCD controller, accessed via the I2C expander
     # (PCA8574)
 
@@ -175,6 +319,71 @@ class LCD(UserList):
     _BACKLIGHT_OFF        = 0b0000
     # fmt: on
 
+    # The display memory start address of each line. Note that the third line
+    # starts immediately after the first, and the fourth follows on from the
+    # second.
+    _LINE_ADDRESSES = (0x00, 0x40, 0x14, 0x54)
+    # The controller has 40 characters of display memory per line, whatever
+    # the size of the display
+    _LINE_LENGTH = 40
+
+    # Tables of the I2C expander bytes for every byte value, with the backlight
+    # on and off. The lookup tables are indexed by register select value, then
+    # byte value. The address tables hold the commands to set the display
+    # memory address, indexed by line and position.
+    _LUTS_BACKLIGHT_ON = (
+        _build_lut(_INSTRUCTION_REGISTER | _WRITE | _BACKLIGHT_ON, _ENABLE),
+        _build_lut(_DATA_REGISTER | _WRITE | _BACKLIGHT_ON, _ENABLE),
+    )
+    _LUTS_BACKLIGHT_OFF = (
+        _build_lut(_INSTRUCTION_REGISTER | _WRITE | _BACKLIGHT_OFF, _ENABLE),
+        _build_lut(_DATA_REGISTER | _WRITE | _BACKLIGHT_OFF, _ENABLE),
+    )
+    _ADDRESSES_BACKLIGHT_ON = _build_address_table(
+        _LUTS_BACKLIGHT_ON[_INSTRUCTION_REGISTER],
+        _LINE_ADDRESSES,
+        _LINE_LENGTH,
+        _Commands.SET_DDRAM_ADDRESS,
+    )
+    _ADDRESSES_BACKLIGHT_OFF = _build_address_table(
+        _LUTS_BACKLIGHT_OFF[_INSTRUCTION_REGISTER],
+        _LINE_ADDRESSES,
+        _LINE_LENGTH,
+        _Commands.SET_DDRAM_ADDRESS,
+    )
+
+    # Maximum time (in seconds) to wait for the display to be cleared. This
+    # should take about 1.52ms; allow some margin.
+    _CLEAR_DISPLAY_DELAY = 0.002
+
+    # Instance attributes are stored in slots for faster access. (The list
+    # content, `data`, is still held in the instance dictionary by `UserList`.)
+    __slots__ = (
+        "_display_width",
+        "_display_height",
+        "_i2c_bus",
+        "_i2c_address",
+        "_i2c_dev",
+        "_smbus",
+        "_bus_failed",
+        "_i2c_transfer",
+        "_backlight",
+        "_display_mode",
+        "_truncate_mode",
+        "_truncate_fn",
+        "_current_start_line",
+        "_luts",
+        "_address_table",
+        "_shadow",
+        "_display_unknown",
+        "_last_lines",
+        "_write_exec",
+        "_background_writes",
+        "_deferred",
+        "_pending",
+        "_suspend_redraw",
+    )
+
     def __init__(
         self,
         iterable: Iterable | None = None,
@@ -182,38 +391,127 @@ class LCD(UserList):
         height: int = 4,
         i2c_address: int = 0x20,
         i2c_bus: int | str = 1,
+        background_writes: bool = False,
+        i2c_clock_hz: int | None = None,
     ):
         # Initialise LCD controller to default state.
 
         super().__init__(iterable)
 
+        # Check the display size is supported by the LCD controller
+        max_height = len(self._LINE_ADDRESSES)
+        if not 1 <= height <= max_height:
+            raise ValueError(
+                f"Display height ({height}) out of range 1 to {max_height}"
+            )
+        if not 1 <= width <= self._LINE_LENGTH:
+            raise ValueError(
+                f"Display width ({width}) out of range 1 to {self._LINE_LENGTH}"
+            )
+
         # Device parameters
         self._display_width = width
         self._display_height = height
         self._i2c_bus = i2c_bus
         self._i2c_address = i2c_address
+        # Worker thread that I2C transfers are made from. This is created now
+        # if background writes are enabled, otherwise when the first
+        # asynchronous update is made.
+        self._background_writes = background_writes
+        if background_writes:
+            self._write_exec = ThreadPoolExecutor(max_workers=1)
+        else:
+            self._write_exec = None
+        # The transfers collected during an asynchronous update, to be run in
+        # the worker thread, or None if transfers are not being collected
+        self._deferred = None
+        # The transfers for the latest asynchronous update, while they may be
+        # in progress
+        self._pending = None
+        # Nesting depth of `batch` blocks; the display isn't redrawn while
+        # this is non-zero
+        self._suspend_redraw = 0
+
+        # Open the I2C bus once and keep it for the lifetime of the object. If
+        # a write fails and the bus can't be reopened, this is set so that the
+        # bus is reopened before the next write.
+        self._bus_failed = False
+        self._open_bus()
+        if i2c_clock_hz is not None:
+            self._check_bus_clock(i2c_clock_hz)
 
         # Default display settings
         self._backlight = True
-        self._display_on = True
-        self._cursor_on = False
-        self._blink_on = False
+        # The display mode command: display on, no cursor
+        self._display_mode = LCD._Commands.SET_DISPLAY_MODE | LCD._Commands.DISPLAY_ON
         self._truncate_mode = self.TruncateMode.TRUNCATE
-        self._scroll_bar = len(self.data) > self._display_height
+        self._truncate_fn = self._make_truncate_fn(self._truncate_mode)
         self._current_start_line = 0
-        # Flag to indicate that the display may be out of date wrt the data
+        # Tables of the I2C byte sequences for each byte value
+        self._luts = self._LUTS_BACKLIGHT_ON
+        self._address_table = self._ADDRESSES_BACKLIGHT_ON
+        # A copy of the character codes currently shown on each line of the
+        # display, so only changes need to be written. Set when the display is
+        # cleared. A line is None if its contents are not known.
+        self._shadow = []
+        # Set if a write fails, so the next redraw rewrites the whole display.
+        # This is only a flag because the write may have been made by the
+        # background writes worker thread, which mustn't change the other
+        # display state.
+        self._display_unknown = False
+        # The lines of text last written, so a redraw that would not change
+        # anything can be skipped
+        self._last_lines = None
 
         # The LCD controller needs at least 15ms after Vcc rises to 4.5V and
-        # 40ms after Vcc rises above 2.7V. So wait even though this probably
-        # won't be run immediately after power-on.
-        sleep(0.04)
+        # 40ms after Vcc rises above 2.7V. This probably won't be run
+        # immediately after power-on but, to be safe, make sure that at least
+        # that long has passed since the module was loaded.
+        deficit = 0.04 - (monotonic() - _MODULE_LOAD_TIME)
+        if deficit > 0:
+            sleep(deficit)
 
         # Configure the interface
         self._function_set()
-        self._set_display_mode()
         self._clear_display()
         self._redraw()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        # Work queued for the worker thread refers to this object, so there is
+        # none left once it is no longer referenced. This may be running in the
+        # worker thread, which can't wait for itself to finish.
+        self._close(wait=False)
+
+    def close(self):
+        """
+        Release the I2C bus. The display contents are left unchanged. No
+        further updates can be made to the display after calling this.
+        """
+
+        self._close(wait=True)
+
+    def _close(self, wait: bool):
+        """
+        Shut down the worker thread and release the I2C bus.
+
+        Args:
+            wait: Wait for the worker thread to finish any queued updates.
+        """
+
+        # Wait for all the queued writes to be sent. The attribute may not
+        # exist if the constructor failed.
+        write_exec = getattr(self, "_write_exec", None)
+        if write_exec is not None:
+            write_exec.shutdown(wait=wait)
+            self._write_exec = None
+        self._close_bus()
+
     #
     # Intercept standard `list` update methods to redraw the display if the list
     # content is changed.
@@ -227,6 +525,16 @@ class LCD(UserList):
         super().extend(other)
         self._redraw()
 
+    def __iadd__(self, other: Iterable) -> LCD:
+        super().__iadd__(other)
+        self._redraw()
+        return self
+
+    def __imul__(self, n: int) -> LCD:
+        super().__imul__(n)
+        self._redraw()
+        return self
+
     def insert(self, i: int, item):
         super().insert(i, item)
         self._redraw()
@@ -247,6 +555,10 @@ class LCD(UserList):
         super().reverse()
         self._redraw()
 
+    def clear(self):
+        super().clear()
+        self._redraw()
+
     def __setitem__(self, i: SupportsIndex, item):
         super().__setitem__(i, item)
         self._redraw()
@@ -255,13 +567,36 @@ class LCD(UserList):
         super().__delitem__(i)
         self._redraw()
 
+    #
+    # Standard `list` methods that create a new list return a plain `list`.
+    # (`UserList` would create another LCD object, which would reinitialise the
+    # display.)
+    #
+
+    def __getitem__(self, i: SupportsIndex | slice[Any, Any, Any]):
+        return self.data[i]
+
+    def __add__(self, other: Iterable) -> list:
+        return self.data + list(other)
+
+    def __radd__(self, other: Iterable) -> list:
+        return list(other) + self.data
+
+    def __mul__(self, n: int) -> list:
+        return self.data * n
+
+    __rmul__ = __mul__
+
+    def copy(self) -> list:
+        return self.data.copy()
+
     def _function_set(self):
         """
         Set the basic operating function: 4 bit interface and number of display
-        lines.
+        lines. The initial display mode is set at the same time.
         """
 
-        debug("Function set")
+        _log.debug("Function set")
 
         # After power-on the LCD controller is in 8-bit mode. We need to set it
         # to 4-bit mode because the I2C expander chip uses four bits for data
@@ -301,26 +636,26 @@ class LCD(UserList):
             command |= N_1_LINE
         else:
             command |= N_2_LINES
-        # Set 4 bit mode
-        self._lcd_write_byte(0, 0b0001_0010)
-        # Set the function-set bits
-        self._write_command(command)
-
-    def _set_display_mode(self):
+        # Set 4 bit mode, then set the function-set bits and the display mode.
+        # These are written in a single transaction; each command takes less
+        # time to execute than it takes to send the next one over I2C.
+        self._i2c_write(
+            self._encode_byte(self._INSTRUCTION_REGISTER, 0b0001_0010)
+            + self._encode_byte(self._INSTRUCTION_REGISTER, command)
+            + self._encode_byte(self._INSTRUCTION_REGISTER, self._display_mode)
+        )
+
+    def _set_display_mode(self, display_mode: int):
         """
-        Set the display mode as defined by the current state.
+        Set the display mode. Nothing is written if the mode is unchanged.
+
+        Args:
+            display_mode: The display mode command.
         """
 
-        # The comand bit for setting the mode
-        display_mode = LCD._Commands.SET_DISPLAY_MODE
-        # Combine the appropriate bites
-        if self._display_on:
-            display_mode |= LCD._Commands.DISPLAY_ON
-        if self._cursor_on:
-            display_mode |= LCD._Commands.CURSOR_ON
-        if self._blink_on:
-            display_mode |= LCD._Commands.BLINK_ON
-        # Write the command
+        if display_mode == self._display_mode:
+            return
+        self._display_mode = display_mode
         self._write_command(display_mode)
 
     def _clear_display(self):
@@ -329,139 +664,209 @@ class LCD(UserList):
         """
 
         self._write_command(self._Commands.CLEAR_DISPLAY)
-        sleep(0.5)
+        self._wait_ready(self._CLEAR_DISPLAY_DELAY)
+        # The display memory is now filled with spaces
+        self._shadow = [b" " * self._display_width] * self._display_height
+        self._last_lines = None
 
-    def _set_display_address(self, line: int, position: int):
+    def _write_lines(self, lines: list[str]):
         """
-        Set the cursor to a given position.
+        Update the display to show text, starting at the first line. Only the
+        characters that differ from the current display contents are written.
+        These are all sent in a single I2C transaction.
 
         Args:
-            line: The line number to move to. Line numbers start from 0.
-            position: The character position to move to, starting from 0.
-
-        Raises:
-            ValueError: If either the line number or character position are out
-                        of range.
+            lines: The text for each line of the display. Lines are cut or
+                   padded with spaces to the display width.
         """
 
-        # The start address of each line. Note that the third line starts
-        # immediately after the first, and the fourth follows on from the
-        # second.
-        line_addresses = [0x00, 0x40, 0x14, 0x54]
-
-        # Check for valid values
-        if not 0 <= line < self._display_height:
-            raise ValueError(
-                f"Line number ({line}) out of range 0 to {self._display_height-1}"
-            )
-        if not 0 <= position < self._display_width:
-            raise ValueError(
-                f"Position ({position}) out of range 0 to {self._display_width-1}"
+        width = self._display_width
+        # If the display is to be blanked, a single clear display command is
+        # quicker than writing spaces over more than about a line's worth of
+        # characters. (The command takes about 1.52ms to execute, while each
+        # character takes four bytes on the I2C bus.) Lines whose contents are
+        # unknown count as full.
+        if not any(s[:width].strip(" ") for s in lines):
+            characters = sum(
+                width if old is None else width - old.count(b" ")
+                for old in self._shadow
             )
-        # Calculate the memory address for this position.
-        address = line_addresses[line] + position
-        # Set the current display memory address
-        self._write_command(LCD._Commands.SET_DDRAM_ADDRESS | address)
-
-    def _print_at(self, line: int, s: str):
-        """
-        Print text at a specified location.
-
-        Args:
-            line: The line number to write to (lines are numbered from 0).
-            position: The character position in the line to start at.
-            s: The string to write.
-        """
-
-        position = 0
-        self._set_display_address(line, position)
-        # Note that it is valid to write past the line; it will wrap round
-        # to the next line. This may be undesirable in the case of a
-        # four-line display where the continuation of a line is not the next
-        # line, but the one after.
-        for ch in bytearray(s, "ascii"):
-            # Write the character to the data memory
-            self._write_data(ch)
-            # Increment position
-            position += 1
-            # Don't go outside the diplay window
-            if position >= self._display_width:
-                break
+            if characters > width:
+                self._clear_display()
+                return
+
+        buffer = []
+        address_table = self._address_table
+        # The lines last written, if the display hasn't been cleared since
+        previous = self._last_lines
+        for line, s in enumerate(lines):
+            # A line with the same text as last time is already on the display,
+            # so there is no need to encode it and compare it
+            if previous is not None and s == previous[line]:
+                continue
+            # Don't go outside the display window; it is valid to write past
+            # the end of a line but it will wrap round to the next line (or, on
+            # a four-line display, the line after that).
+            #
+            # Encoding as Latin-1 maps each character to the character code with
+            # the same value, so the upper half of the character ROM can be
+            # used. Characters outside that range are replaced with "?".
+            new = s[:width].encode("latin-1", errors="replace").ljust(width)
+            old = self._shadow[line]
+            if new == old:
+                continue
+            if old is None:
+                # The contents of the line are unknown after a failed write, so
+                # write all of it
+                buffer.append(address_table[line][0])
+                buffer.append(self._encode_data(new))
+                self._shadow[line] = new
+                continue
+            # Write each run of changed characters, preceded by its address.
+            # Setting the address costs as much as writing one character, so a
+            # single unchanged character between two changes is rewritten
+            # rather than starting a new run.
+            position = 0
+            while position < width:
+                if new[position] == old[position]:
+                    position += 1
+                    continue
+                end = position + 1
+                while end < width and (
+                    new[end] != old[end]
+                    or (end + 1 < width and new[end + 1] != old[end + 1])
+                ):
+                    end += 1
+                buffer.append(address_table[line][position])
+                buffer.append(self._encode_data(new[position:end]))
+                position = end
+            self._shadow[line] = new
+
+        if buffer:
+            self._i2c_write(b"".join(buffer))
 
     def _redraw(self):
 
-        if self._current_start_line > 0:
+        # Changes are written to the display at the end of a batch
+        if self._suspend_redraw:
+            return
+
+        if self._display_unknown:
+            self._display_unknown = False
+            self._shadow = [None] * self._display_height
+            self._last_lines = None
+
+        # Local copies of the attributes used in the loop below
+        width = self._display_width
+        height = self._display_height
+        data = self.data
+        data_length = len(data)
+        start_line = self._current_start_line
+        # Show a scroll bar if the text doesn't fit on the display
+        scroll_bar = data_length > height
+
+        if start_line > 0:
             up = "^"  # chr(0)
         else:
             up = " "
-        if self._current_start_line + self._display_height < len(self.data):
+        if start_line + height < data_length:
             down = "v"  # chr(1)
         else:
             down = " "
 
-        if (
-            self._current_start_line + self._display_height
-        ) < 0 or self._current_start_line > len(self.data):
+        if (start_line + height) < 0 or start_line > data_length:
             # Skip updating if nothing will be displayed
             ##self.clear_display()
-            info(f"|{'.' * self._display_width}|")
+            _log.info("|%s|", "." * width)
         else:
-            info(f"|{'-' * self._display_width}|")
-
-            for display_line in range(self._display_height):
-                if not self._scroll_bar:
+            _log.info("|%s|", "-" * width)
+
+            # Build the text for each line, then write the whole display at once
+            lines = []
+            blank = " " * width
+            truncate = self._truncate_fn
+            for display_line in range(height):
+                if not scroll_bar:
                     prefix = ""
                 elif display_line == 0:
                     prefix = up
-                elif display_line == self._display_height - 1:
+                elif display_line == height - 1:
                     prefix = down
                 else:
                     prefix = " "
 
-                text_index = self._current_start_line + display_line
-                if 0 <= text_index < len(self.data):
-                    text = prefix + self.data[text_index]
-                    text = self._truncate(text, self._display_width)
-                    self._print_at(display_line, text)
-                    info(f"|{text}|")
+                text_index = start_line + display_line
+                if 0 <= text_index < data_length:
+                    text = truncate(prefix + data[text_index])
+                    lines.append(text)
+                    _log.info("|%s|", text)
                 else:
-                    blank_line = " " * (self._display_width - len(prefix))
-                    self._print_at(display_line, prefix + blank_line)
-                    info(f"|{' ' * self._display_width}|")
-            info(f"|{'-' * self._display_width}|")
-
-    def _truncate(self, text: str, width: int):
+                    lines.append(prefix)
+                    _log.info("|%s|", blank)
+            # Nothing needs to be sent if the display already shows this text
+            if lines != self._last_lines:
+                self._write_lines(lines)
+                self._last_lines = lines
+            _log.info("|%s|", "-" * width)
+
+    def _make_truncate_fn(self, mode: LCD.TruncateMode) -> Callable[[str], str]:
         """
-        Truncate a line of text to fit in the display. The truncation is done
-        according to the current mode.
+        Make a function to truncate a line of text to fit in the display,
+        according to a truncation mode. The function pads short lines with
+        spaces. The parameters of the truncation are calculated once, here,
+        rather than for every line.
+
+        Args:
+            mode: The truncation mode.
+
+        Returns:
+            The function, which takes a line of text and returns the text to be
+            displayed.
+
+        Raises:
+            NotImplementedError: For `LCD.TruncateMode.SCROLL`.
+            ValueError: If the mode is not recognised.
         """
 
+        width = self._display_width
         # The string or character to use to mark the truncation
         ellipsis = ".."  # chr(2) + chr(2)
 
-        if len(text) <= width:
-            # Short strings get padded with spaces to fit the display
-            text += " " * (width - len(text))
-        elif self._truncate_mode == self.TruncateMode.TRUNCATE:
+        if mode == self.TruncateMode.TRUNCATE:
             # Truncate the text to the display width
-            text = text[:width]
-        elif self._truncate_mode == self.TruncateMode.ELLIPSIS_END:
+            def cut(text: str) -> str:
+                return text[:width]
+
+        elif mode == self.TruncateMode.ELLIPSIS_END:
             # Cut the end of the string and append the ellipses
-            text = text[: width - len(ellipsis)] + "..."
-        elif self._truncate_mode == self.TruncateMode.ELLIPSIS_MIDDLE:
+            first_length = width - len(ellipsis)
+
+            def cut(text: str) -> str:
+                return text[:first_length] + ellipsis
+
+        elif mode == self.TruncateMode.ELLIPSIS_MIDDLE:
             # Show the start and end of the string with ellipses in the middle
             middle = width / 2
             # Round up the length of the first chunk
-            first = text[: round(middle + 0.1)]
+            first_length = round(middle + 0.1)
             # Round down the length of the last chunk
-            last = text[-(round(middle - 0.1) - len(ellipsis)) :]
-            text = first + ellipsis + last
-        elif self._truncate_mode == self.TruncateMode.SCROLL:
+            last_length = round(middle - 0.1) - len(ellipsis)
+
+            def cut(text: str) -> str:
+                return text[:first_length] + ellipsis + text[-last_length:]
+
+        elif mode == self.TruncateMode.SCROLL:
             raise NotImplementedError("Scroll mode not implemented")
         else:
             raise ValueError("Unknown truncation mode")
 
-        return text
+        def truncate(text: str) -> str:
+            if len(text) <= width:
+                # Short strings get padded with spaces to fit the display
+                return text.ljust(width)
+            return cut(text)
+
+        return truncate
 
     #
     # Functions to access the I2C interface
@@ -476,85 +881,328 @@ class LCD(UserList):
                           register.
         """
 
-        debug(f"Command: {command_bits:09_b}")
-        self._lcd_write_byte(self._INSTRUCTION_REGISTER, command_bits)
+        # The binary format is not supported by lazy %-style logging, so only
+        # format the message when it will be used
+        if _log.isEnabledFor(DEBUG):
+            _log.debug(f"Command: {command_bits:09_b}")
+        self._i2c_write(self._encode_byte(self._INSTRUCTION_REGISTER, command_bits))
+
+    #
+    # Low-level functions to access the LCD controller via I2C
+    #
 
-    def _write_data(self, data: int):
+    def _encode_byte(self, register: int, data: int) -> bytes:
         """
-        Write to the LCD controller data register.
+        Convert a data byte to the sequence of bytes to be written to the I2C
+        expander to transfer it to a register in the LCD controller.
 
         Args:
-            data: The 8-bit value to be written to the register.
+            register: Selects either the instruction or data register.
+            data: The 8-bit data to write.
+
+        Returns:
+            Four bytes to be written to the I2C expander.
         """
 
-        debug(f"Data: {data:09_b}")
-        self._lcd_write_byte(self._DATA_REGISTER, data)
+        return self._luts[register][data]
 
-    #
-    # Low-level functions to access the LCD controller via I2C
-    #
+    def _encode_write(self, command: int, data: bytes) -> bytes:
+        """
+        Convert an instruction (usually setting the CGRAM or DDRAM address)
+        followed by data to the bytes to be written to the I2C expander, so
+        they can be sent in a single transaction.
+
+        Args:
+            command: The 8-bit value to be written to the instruction register.
+            data: The values to be written to the data register.
+
+        Returns:
+            The bytes to be written to the I2C expander.
+        """
+
+        instruction = self._encode_byte(self._INSTRUCTION_REGISTER, command)
+        return instruction + self._encode_data(data)
 
-    def _lcd_write_byte(self, register: int, data: int):
+    def _encode_data(self, text: bytes) -> bytes:
         """
-        Write a data byte to a register in the LCD controller.
+        Convert a sequence of character codes to the bytes to be written to the
+        I2C expander to transfer them to the data register.
 
         Args:
-            register: Selects either the instruction or data register.
-            data: The 8-bit data to write.
+            text: The character codes.
+
+        Returns:
+            Four bytes for each character code.
         """
 
-        debug(f"write_lcd: {register=}, {data=:09_b}")
+        lut = self._luts[self._DATA_REGISTER]
+        return b"".join([lut[ch] for ch in text])
+
+    def _open_bus(self):
+        """
+        Open the I2C bus. The bus device is accessed directly if possible,
+        otherwise via smbus2. If neither is available, the display output is
+        only logged.
+        """
 
-        # Data has to be written as two 4-bit values
-        lo = data & 0x0F
-        hi = data & 0xF0
-        # Write the upper bits then the lower bits
-        # Data to be written must be in the upper 4 bits
-        # Combine the data with the register select bit
-        self._lcd_write4(register, hi)
-        self._lcd_write4(register, (lo << 4))
+        self._i2c_dev = None
+        self._smbus = None
+        try:
+            if I2CDevice is not None:
+                self._i2c_dev = I2CDevice(self._i2c_bus, self._i2c_address)
+        except OSError:
+            pass
+        if self._i2c_dev is None and SMBus is not None:
+            self._smbus = SMBus(bus=self._i2c_bus)
+        # Select the write function once, rather than on every write. This
+        # mustn't be a bound method of this object, as that would create a
+        # reference cycle and delay closing the bus until garbage collection.
+        if self._i2c_dev is not None:
+            self._i2c_transfer = self._i2c_dev.write
+        elif self._smbus is not None:
+            self._i2c_transfer = partial(
+                _smbus_transfer, self._smbus, self._i2c_address
+            )
+        else:
+            self._i2c_transfer = _no_transfer
 
-    def _lcd_write4(self, register: int, data: int):
+    def _check_bus_clock(self, clock_hz: int):
         """
-        Write 4 bits of data to the LCD controller.
+        Check the clock frequency that the I2C bus has been configured with,
+        and log a warning if it is lower than expected. The frequency is read
+        from the device tree, so this only works on systems that use one, such
+        as the Raspberry Pi.
 
         Args:
-            register: Selects either the instruction or data register.
-            data: Data in the upper 4 bits of the byte.
+            clock_hz: The expected clock frequency, in Hz.
         """
 
-        # Combine the register select and write bit with the data
-        data |= register | self._WRITE
-        # Set the backlight control bit appropriately
-        if self._backlight:
-            data |= self._BACKLIGHT_ON
+        if not isinstance(self._i2c_bus, int):
+            return
+        path = f"/sys/class/i2c-adapter/i2c-{self._i2c_bus}/of_node/clock-frequency"
+        try:
+            with open(path, "rb") as file:
+                # Device tree properties are stored as big-endian integers
+                actual_hz = int.from_bytes(file.read(4), "big")
+        except OSError:
+            return
+        if actual_hz < clock_hz:
+            _log.warning(
+                "I2C bus %d clock is %d Hz, lower than the expected %d Hz",
+                self._i2c_bus,
+                actual_hz,
+                clock_hz,
+            )
+
+    def _close_bus(self):
+        """
+        Close the I2C bus, if it is open.
+        """
+
+        # The attributes may not exist if the constructor failed
+        i2c_dev = getattr(self, "_i2c_dev", None)
+        if i2c_dev is not None:
+            i2c_dev.close()
+            self._i2c_dev = None
+        smbus = getattr(self, "_smbus", None)
+        if smbus is not None:
+            smbus.close()
+            self._smbus = None
+        self._i2c_transfer = _no_transfer
+
+    def _i2c_write(self, data: bytes):
+        """
+        Write a sequence of bytes to the I2C address as a single transaction.
+        If background writes are enabled, the write is queued for the worker
+        thread and this returns immediately.
+
+        Args:
+            data: The bytes to write.
+        """
+
+        self._transfer(self._i2c_write_now, data)
+
+    def _transfer(self, func: Callable, *args):
+        """
+        Make an I2C transfer, or queue it to be made by the worker thread.
+        Transfers are always made in the order they are requested.
+
+        Args:
+            func: The function that makes the transfer.
+            args: The arguments to the function.
+        """
+
+        if self._deferred is not None:
+            # Collected by an asynchronous update
+            self._deferred.append(partial(func, *args))
+        elif self._background_writes:
+            future = self._write_exec.submit(func, *args)
+            future.add_done_callback(self._log_background_error)
+        elif self._pending is not None and not self._pending.done():
+            # An asynchronous update is still in progress, so this has to be
+            # made by the worker thread, after it
+            self._write_exec.submit(func, *args).result()
         else:
-            data |= self._BACKLIGHT_OFF
-        # Apply the data to the LCD controller with the Enable bit asserted
-        self._i2c_write(data | self._ENABLE)
-        # De-assert the Enable bit to complete the write
-        self._i2c_write(data)
+            self._pending = None
+            func(*args)
 
-    def _i2c_write(self, data: int):
+    def _i2c_write_now(self, data: bytes):
         """
-        Write one byte to the I2C address.
+        Write a sequence of bytes to the I2C address as a single transaction.
+        The port expander updates its outputs as each byte is received.
+
+        If the write fails, the bus is reopened and the write is tried once
+        more, in case the bus has been reset. If that fails too, the display
+        contents are treated as unknown, so the next redraw rewrites the whole
+        display, and the bus is reopened again before the next write.
 
         Args:
-            data: The 8-bit value to write.
+            data: The bytes to write.
+
+        Raises:
+            OSError: If the write fails after reopening the bus, or the bus
+                     can't be reopened.
         """
 
+        if not self._bus_failed:
+            try:
+                self._i2c_transfer(data)
+                return
+            except OSError as error:
+                _log.warning("I2C write failed (%s); reopening bus", error)
         try:
-            # pylint: disable=import-outside-toplevel
-            from smbus2 import SMBus
-        # pylint: disable=bare-except
-        except:
-            pass
+            self._reopen_bus()
+            self._i2c_transfer(data)
+        except OSError:
+            self._bus_failed = True
+            self._display_unknown = True
+            raise
+        self._bus_failed = False
+
+    def _reopen_bus(self):
+        """
+        Close and reopen the I2C bus, for example after it has been reset.
+
+        Raises:
+            OSError: If the bus can't be reopened.
+        """
+
+        self._close_bus()
+        self._open_bus()
+        if self._i2c_dev is None and self._smbus is None:
+            raise OSError(errno.ENODEV, f"Can't reopen I2C bus {self._i2c_bus}")
+
+    def _i2c_strobe_read(self, before: bytes, after: bytes) -> int | None:
+        """
+        Write some bytes, read one byte and then write some more bytes to the
+        I2C address, as a single transaction.
+
+        Args:
+            before: The bytes to write before the read.
+            after: The bytes to write after the read.
+
+        Returns:
+            The value of the port expander inputs, or None if the I2C bus is not
+            available.
+        """
+
+        if self._i2c_dev is not None:
+            return self._i2c_dev.transfer(before, 1, after)[0][0]
+        if self._smbus is not None:
+            read = i2c_msg.read(self._i2c_address, 1)
+            self._smbus.i2c_rdwr(
+                i2c_msg.write(self._i2c_address, before),
+                read,
+                i2c_msg.write(self._i2c_address, after),
+            )
+            return list(read)[0]
+        return None
+
+    def _read_busy_flag(self, backlight: int) -> bool | None:
+        """
+        Read the busy flag from the LCD controller.
+
+        Args:
+            backlight: The backlight control bit to output during the read.
+
+        Returns:
+            True if the LCD controller is busy, False if it is ready for the
+            next instruction, or None if the I2C bus is not available.
+        """
+
+        # Set the data bits high so the port expander pins can be used as
+        # inputs, and select a read from the instruction register. The busy
+        # flag is bit 7, which is read with the upper 4 bits while the Enable
+        # bit is asserted.
+        control = 0xF0 | self._INSTRUCTION_REGISTER | self._READ | backlight
+        # After the read, de-assert Enable to complete the read of the upper 4
+        # bits, then clock out the lower 4 bits (which are not needed).
+        value = self._i2c_strobe_read(
+            bytes((control | self._ENABLE,)),
+            bytes((control, control | self._ENABLE, control)),
+        )
+        if value is None:
+            return None
+        return bool(value & 0x80)
+
+    def _wait_ready(self, timeout: float):
+        """
+        Wait until the LCD controller has finished executing an instruction.
+        If background writes are enabled, the wait is queued for the worker
+        thread, so it delays the writes that follow it but not the caller.
+
+        Args:
+            timeout: The maximum time to wait, in seconds.
+        """
+
+        # The backlight state is taken now, rather than when a queued wait is
+        # run, so the reads don't change the backlight ahead of the writes
+        # queued before them
+        if self._backlight:
+            backlight = self._BACKLIGHT_ON
         else:
-            with SMBus(bus=self._i2c_bus) as smbus:
-                smbus.write_byte(
-                    i2c_addr=self._i2c_address,
-                    value=data,
-                )
+            backlight = self._BACKLIGHT_OFF
+        self._transfer(self._wait_ready_now, timeout, backlight)
+
+    def _wait_ready_now(self, timeout: float, backlight: int):
+        """
+        Wait until the LCD controller has finished executing an instruction,
+        by polling the busy flag.
+
+        If the busy flag can't be read (for example, if the I2C bus is not
+        available or the R/W line is not connected) this waits for the full
+        timeout, which should be the maximum execution time of the
+        instruction.
+
+        Args:
+            timeout: The maximum time to wait, in seconds.
+            backlight: The backlight control bit to output while waiting.
+        """
+
+        deadline = monotonic() + timeout
+        try:
+            busy = self._read_busy_flag(backlight)
+            while busy and monotonic() < deadline:
+                busy = self._read_busy_flag(backlight)
+        except OSError as error:
+            _log.debug("Can't read busy flag (%s)", error)
+            busy = None
+        if busy is None:
+            # Wait for the rest of the timeout instead
+            remaining = deadline - monotonic()
+            if remaining > 0:
+                _delay(remaining)
+
+    @staticmethod
+    def _log_background_error(future: Future):
+        """
+        Log an exception raised by a transfer in the background writes worker
+        thread, as there is no caller to report it to.
+        """
+
+        error = future.exception()
+        if error is not None:
+            _log.error("Background I2C transfer failed: %s", error)
 
     #
     # User level functions
@@ -576,10 +1224,11 @@ class LCD(UserList):
         if len(bitmap) != 8:
             raise ValueError("The bitmap for a custom character must have eight rows.")
 
-        for row, bits in enumerate(bitmap):
-            address = code << 3 | row
-            self._write_command(LCD._Commands.SET_CGRAM_ADDRESS | address)
-            self._write_data(bits)
+        # Set the address of the first row; the address is incremented as each
+        # row is written. The address and all the rows are written in a single
+        # transaction.
+        command = LCD._Commands.SET_CGRAM_ADDRESS | code << 3
+        self._i2c_write(self._encode_write(command, bytes(bitmap)))
 
     def display_on(self, on: bool):
         """
@@ -591,8 +1240,11 @@ class LCD(UserList):
                 visible when the display is turned on again).
         """
 
-        self._display_on = on
-        self._set_display_mode()
+        on = bool(on)
+        if on:
+            self._set_display_mode(self._display_mode | LCD._Commands.DISPLAY_ON)
+        else:
+            self._set_display_mode(self._display_mode & ~LCD._Commands.DISPLAY_ON)
 
     def set_cursor(self, style: LCD.Cursor):
         """
@@ -601,22 +1253,17 @@ class LCD(UserList):
 
         Args:
             style: Specifies the type of cursor to use.
-        """
 
-        # Set the appropriate flags for the type of cursor
-        if style == LCD.Cursor.NONE:
-            # Turn the underline cursor on or off.
-            self._cursor_on = False
-            self._blink_on = False
-        elif style == LCD.Cursor.BLINK:
-            self._cursor_on = False
-            self._blink_on = True
-        elif style == LCD.Cursor.UNDERSCORE:
-            self._cursor_on = True
-            self._blink_on = False
+        Raises:
+            ValueError: If the cursor style is not recognised.
+        """
 
-        # Apply those settings
-        self._set_display_mode()
+        try:
+            cursor_bits = self._CURSOR_BITS[style]
+        except KeyError:
+            raise ValueError("Unknown cursor style") from None
+        # Replace the cursor bits in the display mode and apply the new mode
+        self._set_display_mode((self._display_mode & ~self._CURSOR_MASK) | cursor_bits)
 
     def backlight_on(self, on: bool):
         """
@@ -626,8 +1273,22 @@ class LCD(UserList):
             on: If set to True, the backlight will be on.
         """
 
+        on = bool(on)
+        if on == self._backlight:
+            return
         self._backlight = on
-        self._write_command(0)
+        # Select the tables with the backlight control bit set appropriately
+        if on:
+            self._luts = self._LUTS_BACKLIGHT_ON
+            self._address_table = self._ADDRESSES_BACKLIGHT_ON
+            control = self._WRITE | self._BACKLIGHT_ON
+        else:
+            self._luts = self._LUTS_BACKLIGHT_OFF
+            self._address_table = self._ADDRESSES_BACKLIGHT_OFF
+            control = self._WRITE | self._BACKLIGHT_OFF
+        # Update the backlight output of the expander. The Enable bit is not
+        # asserted, so nothing is written to the LCD controller.
+        self._i2c_write(bytes((control,)))
 
     def show(self, start_line: int):
         """
@@ -647,15 +1308,25 @@ class LCD(UserList):
 
         self._redraw()
 
+    def force_redraw(self):
+        """
+        Clear the display and write the whole of the current content to it.
+        Normally only the characters that have changed are written to the
+        display; this can be used if the display contents may have been
+        corrupted.
+        """
+
+        self._clear_display()
+        self._redraw()
+
     def set_truncate_mode(self, mode: LCD.TruncateMode):
         """
         Set the truncate mode to be used when displaying the text buffer on the
         LCD.
         """
 
-        if self._truncate_mode == self.TruncateMode.SCROLL:
-            raise NotImplementedError("Scroll mode not implemented")
-
+        # This raises an exception if the mode is not supported
+        self._truncate_fn = self._make_truncate_fn(mode)
         self._truncate_mode = mode
 
     def assign(self, text: Iterable):
@@ -663,9 +1334,72 @@ class LCD(UserList):
         Assign new data to the text list.
         """
         self.data = list(text)
-        self._scroll_bar = len(self.data) > self._display_height
         self._redraw()
 
+    @contextmanager
+    def batch(self) -> Iterator[LCD]:
+        """
+        A context manager to make several changes to the text list with a
+        single update of the display. The display is redrawn when the
+        outermost `with` block exits. For example:
+
+            with lcd.batch():
+                lcd[0] = "Temperature: 21C"
+                lcd[1] = "Humidity: 40%"
+        """
+
+        self._suspend_redraw += 1
+        try:
+            yield self
+        finally:
+            self._suspend_redraw -= 1
+            self._redraw()
+
+    #
+    # Asynchronous versions of the user level functions. The text list and
+    # display state are updated immediately, in the calling thread, and the
+    # data is written to the I2C bus in a worker thread so the event loop can
+    # continue. Updates are written in the order they are requested, including
+    # any made with the synchronous functions.
+    #
+    # The LCD object is not thread-safe: all the functions should be called
+    # from the same thread (normally the thread running the event loop).
+    #
+
+    async def aassign(self, text: Iterable):
+        """
+        Assign new data to the text list, without blocking the event loop. See
+        `assign`.
+        """
+
+        await self._run_in_executor(self.assign, list(text))
+
+    async def ashow(self, start_line: int):
+        """
+        Update the LCD to display the contents of the text buffer, starting at
+        `start_line`, without blocking the event loop. See `show`.
+        """
+
+        await self._run_in_executor(self.show, start_line)
+
+    async def _run_in_executor(self, func: Callable, *args):
+        """
+        Run a function that updates the display, with the I2C transfers it
+        makes run in the worker thread. Returns when the transfers are done.
+        """
+
+        self._deferred = transfers = []
+        try:
+            func(*args)
+        finally:
+            self._deferred = None
+            # Send whatever was encoded, even if the function failed part way
+            # through, so the display matches the record of its contents
+            if self._write_exec is None:
+                self._write_exec = ThreadPoolExecutor(max_workers=1)
+            self._pending = self._write_exec.submit(_run_all, transfers)
+        await asyncio.wrap_future(self._pending)
+
 
 if __name__ == "__main__":
 
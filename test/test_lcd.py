@@ -0,0 +1,362 @@
+#
+# Tests for the LCD class, using a model of the LCD controller in place of the
+# I2C bus and display hardware.
+#
+# Run with:
+#
+#   python -m pytest test
+#
+
+import asyncio
+import errno
+import random
+
+import pytest
+
+import i2c_lcd.lcd as lcd_module
+from i2c_lcd import LCD
+
+# The display memory start address of each line
+LINE_ADDRESSES = (0x00, 0x40, 0x14, 0x54)
+
+
+class HD44780:
+    """
+    A minimal model of an HD44780 LCD controller connected to a PCA8574 port
+    expander in the usual way, driven by the bytes written to the expander.
+    Only the features used by the LCD class are modelled.
+    """
+
+    def __init__(self):
+        self.ddram = bytearray(b" " * 128)
+        self.cgram = bytearray(64)
+        self.address = 0
+        self.cgram_selected = False
+        self.backlight = None
+        self.display_mode = None
+        self.clear_count = 0
+        # The controller starts in 8-bit mode; the LCD class sends two 4-bit
+        # values before switching it to 4-bit mode
+        self._8bit_writes = 2
+        self._high_nibble = None
+        self._previous = 0
+
+    def output(self, value: int):
+        """
+        Set the outputs of the port expander.
+        """
+
+        self.backlight = bool(value & 0x08)
+        # Data is written on the falling edge of Enable, unless R/W is set
+        if self._previous & 0x04 and not value & 0x04 and not self._previous & 0x02:
+            self._nibble(self._previous & 0x01, self._previous & 0xF0)
+        self._previous = value
+
+    def _nibble(self, register: int, bits: int):
+        if self._8bit_writes:
+            self._8bit_writes -= 1
+            self._execute(register, bits)
+        elif self._high_nibble is None:
+            self._high_nibble = bits
+        else:
+            self._execute(register, self._high_nibble | bits >> 4)
+            self._high_nibble = None
+
+    def _execute(self, register: int, value: int):
+        if register:
+            if self.cgram_selected:
+                self.cgram[self.address & 0x3F] = value
+            else:
+                self.ddram[self.address & 0x7F] = value
+            self.address += 1
+        elif value == 0x01:
+            self.ddram[:] = b" " * len(self.ddram)
+            self.address = 0
+            self.cgram_selected = False
+            self.clear_count += 1
+        elif value & 0x80:
+            self.address = value & 0x7F
+            self.cgram_selected = False
+        elif value & 0x40:
+            self.address = value & 0x3F
+            self.cgram_selected = True
+        elif value & 0xF8 == 0x08:
+            self.display_mode = value
+
+    def screen(self, width: int, height: int) -> list[str]:
+        """
+        Get the text shown on each line of the display.
+        """
+
+        return [
+            self.ddram[start : start + width].decode("latin-1")
+            for start in LINE_ADDRESSES[:height]
+        ]
+
+
+class FakeI2CDevice:
+    """
+    Used in place of `I2CDevice`. Each bus number has its own LCD controller
+    model, in `panels`. Writes and reopening the bus can be made to fail.
+    """
+
+    panels = {}
+    fail_writes = False
+    fail_open = False
+
+    def __init__(self, bus: int, address: int):
+        if FakeI2CDevice.fail_open:
+            raise OSError(errno.ENODEV, "No such device")
+        self.panel = self.panels.setdefault(bus, HD44780())
+
+    def write(self, data: bytes):
+        if FakeI2CDevice.fail_writes:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        for value in data:
+            self.panel.output(value)
+
+    def transfer(self, *messages: bytes | int) -> list[bytes]:
+        if FakeI2CDevice.fail_writes:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        reads = []
+        for message in messages:
+            if isinstance(message, int):
+                # The busy flag is never set
+                reads.append(bytes(message))
+            else:
+                for value in message:
+                    self.panel.output(value)
+        return reads
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fake_bus(monkeypatch):
+    """
+    Connect LCD objects to the LCD controller models rather than the I2C bus.
+    """
+
+    monkeypatch.setattr(lcd_module, "I2CDevice", FakeI2CDevice)
+    monkeypatch.setattr(lcd_module, "SMBus", None)
+    monkeypatch.setattr(FakeI2CDevice, "panels", {})
+    monkeypatch.setattr(FakeI2CDevice, "fail_writes", False)
+    monkeypatch.setattr(FakeI2CDevice, "fail_open", False)
+    return FakeI2CDevice.panels
+
+
+def screen(lcd: LCD, bus: int = 1) -> list[str]:
+    return FakeI2CDevice.panels[bus].screen(lcd._display_width, lcd._display_height)
+
+
+def fresh_screen(lcd: LCD) -> list[str]:
+    """
+    Get what a newly created LCD object shows for the same text and settings.
+    """
+
+    with LCD(width=lcd._display_width, height=lcd._display_height, i2c_bus=99) as fresh:
+        fresh.set_truncate_mode(lcd._truncate_mode)
+        fresh.show(lcd._current_start_line)
+        fresh.assign(list(lcd))
+        return screen(fresh, 99)
+
+
+def test_initial_text():
+    lcd = LCD(["Hello", "world"], width=8, height=2)
+    assert screen(lcd) == ["Hello   ", "world   "]
+
+
+def test_list_updates():
+    lcd = LCD(["one", "two"], width=8, height=2)
+    lcd[0] = "ONE"
+    assert screen(lcd) == ["ONE     ", "two     "]
+    lcd.insert(0, "zero")
+    assert screen(lcd) == [" zero   ", "vONE    "]
+    lcd.pop(0)
+    assert screen(lcd) == ["ONE     ", "two     "]
+    lcd.reverse()
+    assert screen(lcd) == ["two     ", "ONE     "]
+    lcd.sort()
+    assert screen(lcd) == ["ONE     ", "two     "]
+    del lcd[0]
+    assert screen(lcd) == ["two     ", "        "]
+    lcd += ["three"]
+    assert screen(lcd) == ["two     ", "three   "]
+    lcd *= 2
+    assert screen(lcd) == [" two    ", "vthree  "]
+    lcd.clear()
+    assert screen(lcd) == ["        ", "        "]
+    lcd.extend(["a", "b"])
+    assert screen(lcd) == ["a       ", "b       "]
+
+
+def test_show_scrolls_text():
+    lcd = LCD(["a", "b", "c", "d"], width=4, height=2)
+    assert screen(lcd) == [" a  ", "vb  "]
+    lcd.show(1)
+    assert screen(lcd) == ["^b  ", "vc  "]
+    lcd.show(2)
+    assert screen(lcd) == ["^c  ", " d  "]
+
+
+def test_truncate_modes():
+    lcd = LCD(["abcdefghijkl"], width=8, height=1)
+    assert screen(lcd) == ["abcdefgh"]
+    lcd.set_truncate_mode(LCD.TruncateMode.ELLIPSIS_END)
+    lcd.force_redraw()
+    assert screen(lcd) == ["abcdef.."]
+    lcd.set_truncate_mode(LCD.TruncateMode.ELLIPSIS_MIDDLE)
+    lcd.force_redraw()
+    assert screen(lcd) == ["abcd..kl"]
+
+
+def test_batch_redraws_once():
+    lcd = LCD(["one", "two"], width=8, height=2)
+    with lcd.batch():
+        lcd[0] = "ONE"
+        lcd[1] = "TWO"
+        assert screen(lcd) == ["one     ", "two     "]
+    assert screen(lcd) == ["ONE     ", "TWO     "]
+
+
+def test_backlight():
+    lcd = LCD(["text"], width=8, height=1)
+    panel = FakeI2CDevice.panels[1]
+    assert panel.backlight
+    lcd.backlight_on(False)
+    assert not panel.backlight
+    # Writes leave the backlight off
+    lcd[0] = "changed"
+    assert not panel.backlight
+    assert screen(lcd) == ["changed "]
+    lcd.backlight_on(True)
+    assert panel.backlight
+
+
+def test_display_mode_and_cursor():
+    lcd = LCD(width=8, height=1)
+    panel = FakeI2CDevice.panels[1]
+    assert panel.display_mode == 0b1100
+    lcd.set_cursor(LCD.Cursor.UNDERSCORE)
+    assert panel.display_mode == 0b1110
+    lcd.display_on(False)
+    assert panel.display_mode == 0b1010
+    with pytest.raises(ValueError):
+        lcd.set_cursor(None)
+
+
+def test_custom_character():
+    lcd = LCD(width=8, height=1)
+    bitmap = [1, 2, 3, 4, 5, 6, 7, 8]
+    lcd.define_custom_character(3, bitmap)
+    assert list(FakeI2CDevice.panels[1].cgram[24:32]) == bitmap
+
+
+def test_force_redraw_repairs_display():
+    lcd = LCD(["one", "two"], width=8, height=2)
+    FakeI2CDevice.panels[1].ddram[:] = b"#" * 128
+    lcd.force_redraw()
+    assert screen(lcd) == ["one     ", "two     "]
+
+
+def test_blanking_short_line_does_not_clear():
+    lcd = LCD(["ab"], width=8, height=2)
+    panel = FakeI2CDevice.panels[1]
+    clear_count = panel.clear_count
+    lcd.clear()
+    assert screen(lcd) == ["        ", "        "]
+    assert panel.clear_count == clear_count
+
+
+def test_copies_are_plain_lists():
+    lcd = LCD(["one", "two", "three", "four"], width=8, height=4)
+    part = lcd[2:4]
+    assert type(part) is list
+    assert type(lcd.copy()) is list
+    assert type(lcd + ["five"]) is list
+    assert type(lcd * 2) is list
+    lcd[0] = "ONE"
+    assert screen(lcd) == ["ONE     ", "two     ", "three   ", "four    "]
+
+
+def test_invalid_size():
+    with pytest.raises(ValueError):
+        LCD(width=41)
+    with pytest.raises(ValueError):
+        LCD(height=5)
+
+
+def test_write_failure_and_recovery():
+    lcd = LCD(["one", "two"], width=8, height=2)
+    FakeI2CDevice.fail_writes = True
+    FakeI2CDevice.fail_open = True
+    with pytest.raises(OSError):
+        lcd[0] = "ONE"
+    with pytest.raises(OSError):
+        lcd[1] = "TWO"
+    # The display loses its contents while the bus is unavailable
+    FakeI2CDevice.panels[1].ddram[:] = b"#" * 128
+    FakeI2CDevice.fail_writes = False
+    FakeI2CDevice.fail_open = False
+    lcd[1] = "TWO"
+    assert screen(lcd) == ["ONE     ", "TWO     "]
+
+
+def test_aassign_and_ashow():
+    async def update(lcd):
+        await lcd.aassign(["a", "b", "c"])
+        # The text is updated immediately; only the writes are asynchronous
+        task = asyncio.ensure_future(lcd.ashow(1))
+        await asyncio.sleep(0)
+        assert lcd._current_start_line == 1
+        lcd[2] = "C"
+        await task
+
+    with LCD(width=4, height=2) as lcd:
+        asyncio.run(update(lcd))
+        assert screen(lcd) == ["^b  ", " C  "]
+        lcd[1] = "B"
+        assert screen(lcd) == ["^B  ", " C  "]
+
+
+def test_background_writes():
+    lcd = LCD(["one"], width=8, height=2, background_writes=True)
+    lcd[0] = "ONE"
+    lcd.append("two")
+    lcd.backlight_on(False)
+    lcd.close()
+    assert screen(lcd) == ["ONE     ", "two     "]
+    assert not FakeI2CDevice.panels[1].backlight
+
+
+@pytest.mark.parametrize("background_writes", [False, True])
+def test_random_updates_match_fresh_render(background_writes):
+    rng = random.Random(1)
+    words = ["", "a", "ab", "hello", "hello world", "x" * 30, "\xe9t\xe9"]
+    lcd = LCD(width=10, height=4, background_writes=background_writes)
+    for _ in range(300):
+        operation = rng.randrange(7)
+        if operation == 0:
+            lcd.append(rng.choice(words))
+        elif operation == 1 and lcd:
+            lcd[rng.randrange(len(lcd))] = rng.choice(words)
+        elif operation == 2 and lcd:
+            del lcd[rng.randrange(len(lcd))]
+        elif operation == 3:
+            lcd.show(rng.randrange(-1, len(lcd) + 1))
+        elif operation == 4:
+            lcd.assign(rng.choices(words, k=rng.randrange(6)))
+        elif operation == 5:
+            lcd.sort()
+        else:
+            lcd.set_truncate_mode(rng.choice(list(LCD.TruncateMode)[:3]))
+            lcd.force_redraw()
+        if background_writes:
+            # Wait for the queued writes
+            lcd._write_exec.submit(lambda: None).result()
+        # The display isn't updated if the start line is past the end of the
+        # text, so it only has known contents otherwise
+        if lcd._current_start_line <= len(lcd):
+            assert screen(lcd) == fresh_screen(lcd)
+    lcd.close()